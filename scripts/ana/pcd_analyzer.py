@@ -11,7 +11,15 @@ import os
 from pathlib import Path
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy import fftpack
+from scipy.fft import fftshift
+
+# 优先使用pyfftw作为FFT后端（支持计划缓存），否则回退到scipy.fft
+try:
+    import pyfftw
+    from pyfftw.interfaces.scipy_fft import rfftn
+    pyfftw.interfaces.cache.enable()
+except ImportError:
+    from scipy.fft import rfftn
 
 
 # 导入open3d库用于点云处理
@@ -24,6 +32,65 @@ except ImportError:
     print("警告: 未安装open3d库，部分功能可能受限")
     print("可通过 'pip install open3d' 安装")
 
+# 导入numba用于加速直方图计算，未安装时使用np.histogram
+try:
+    from numba import njit, prange, get_num_threads
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _hist_numba(values, bin_edges, num_chunks):
+        """
+        并行计算等宽直方图，每个线程累加到独立的局部直方图后再合并
+        分箱方式与np.histogram相同：先按比例计算bin索引，再与边界比较修正浮点误差，
+        最后一个bin包含右边界
+        """
+        n = values.shape[0]
+        nbins = bin_edges.shape[0] - 1
+        first_edge = bin_edges[0]
+        last_edge = bin_edges[nbins]
+        norm = nbins / (last_edge - first_edge)
+        chunk_size = (n + num_chunks - 1) // num_chunks
+        local_hist = np.zeros((num_chunks, nbins), dtype=np.int64)
+        
+        for c in prange(num_chunks):
+            start = c * chunk_size
+            end = min(start + chunk_size, n)
+            for i in range(start, end):
+                v = values[i]
+                # 范围外的值和NaN都不计数
+                if not (v >= first_edge and v <= last_edge):
+                    continue
+                idx = int((v - first_edge) * norm)
+                if idx >= nbins:
+                    idx = nbins - 1
+                if v < bin_edges[idx]:
+                    idx -= 1
+                elif idx != nbins - 1 and v >= bin_edges[idx + 1]:
+                    idx += 1
+                local_hist[c, idx] += 1
+        
+        return local_hist.sum(axis=0)
+
+
+def _histogram(values, bins, vmin, vmax):
+    """
+    计算[vmin, vmax]范围内的等宽直方图
+    安装了numba时使用并行内核，否则使用np.histogram，两者结果一致
+    
+    Returns:
+        tuple: (hist, bin_edges) 直方图数据和边界
+    """
+    if NUMBA_AVAILABLE and vmax > vmin:
+        bin_edges = np.histogram_bin_edges(values, bins=bins, range=(vmin, vmax))
+        # 线程数作为参数传入，内核不依赖运行时状态，才能被cache=True缓存
+        hist = _hist_numba(np.ascontiguousarray(values), bin_edges, get_num_threads())
+        return hist, bin_edges
+    return np.histogram(values, bins=bins, range=(vmin, vmax))
+
 
 def read_pcd_file(file_path):
     """
@@ -41,11 +108,12 @@ def read_pcd_file(file_path):
     # 使用open3d读取
     if O3D_AVAILABLE:
         try:
-            pcd = o3d.io.read_point_cloud(file_path)
-            points = np.asarray(pcd.points)
+            # 使用Tensor API读取，.numpy()直接共享底层内存，无需额外复制
+            pcd = o3d.t.io.read_point_cloud(file_path)
+            points = pcd.point.positions.numpy()
             # 如果存在颜色信息也一并提取
-            if pcd.has_colors():
-                colors = np.asarray(pcd.colors)
+            if "colors" in pcd.point:
+                colors = pcd.point.colors.numpy()
                 points = np.hstack((points, colors))
             return points
         except Exception as e:
@@ -68,7 +136,7 @@ def compute_h_histogram(points, bins=100, axis=2):
         tuple: (hist, bin_edges) 直方图数据和边界
     """
     heights = points[:, axis]
-    hist, bin_edges = np.histogram(heights, bins=bins)
+    hist, bin_edges = _histogram(heights, bins, heights.min(), heights.max())
     return hist, bin_edges
 
 
@@ -99,20 +167,47 @@ def compute_point_projection_histogram(points, reference_vector=None, resolution
     # 计算点到参考向量的投影
     projections = np.dot(points[:, :3], reference_vector)
     
-    # 按投影值排序
-    sorted_projections = np.sort(projections)
-    
     # 根据分辨率计算bins数量
-    min_proj = np.min(sorted_projections)
-    max_proj = np.max(sorted_projections)
+    min_proj = projections.min()
+    max_proj = projections.max()
     bins = int(np.ceil((max_proj - min_proj) / resolution))
     bins = max(bins, 1)  # 确保至少有1个bin
     
-    # 计算直方图
-    hist, bin_edges = np.histogram(sorted_projections, bins=bins)
+    # 计算直方图（np.histogram不要求输入有序，传入range避免重复求最值）
+    hist, bin_edges = np.histogram(projections, bins=bins, range=(min_proj, max_proj))
     return hist, bin_edges
 
 
+def _compute_all_histograms(points, bins=100, proj_resolution=0.1):
+    """
+    一次性计算X/Y/Z轴直方图和Z轴方向的点投影直方图
+    
+    先将坐标转换为按轴连续存储，每个直方图都在连续内存上计算，
+    Z轴方向的投影即为Z坐标本身，与Z轴直方图共用同一列数据和范围。
+    
+    Args:
+        points (numpy.ndarray): 点云数据 (N, 3) 或 (N, 4) 数组
+        bins (int): 各轴直方图bins数量
+        proj_resolution (float): 投影直方图的分辨率
+        
+    Returns:
+        dict: 键为 "x"、"y"、"z"、"projection"，值为 (hist, bin_edges)
+    """
+    coords = np.ascontiguousarray(points[:, :3].T)
+    mins = coords.min(axis=1)
+    maxs = coords.max(axis=1)
+    
+    histograms = {}
+    for i, name in enumerate(("x", "y", "z")):
+        histograms[name] = _histogram(coords[i], bins, mins[i], maxs[i])
+    
+    # Z轴方向投影，bins数量由分辨率决定
+    proj_bins = max(int(np.ceil((maxs[2] - mins[2]) / proj_resolution)), 1)
+    histograms["projection"] = _histogram(coords[2], proj_bins, mins[2], maxs[2])
+    
+    return histograms
+
+
 def plot_histogram(hist, bin_edges, title="Histogram", xlabel="Value", ylabel="Frequency", 
                    color='skyblue', edgecolor='black'):
     """
@@ -149,38 +244,42 @@ def compute_3d_fft_spectrum(points, grid_size=64):
     Returns:
         tuple: (magnitude_spectrum, freq_radius, radial_profile)
                包含幅度谱、频率半径和径向轮廓
+               由于输入为实数，幅度谱和频率半径只保留最后一个轴的非负频率部分，
+               形状为 (grid_size, grid_size, grid_size // 2 + 1)
     """
     # 获取点云边界
     min_bound = np.min(points[:, :3], axis=0)
     max_bound = np.max(points[:, :3], axis=0)
     
-    # 创建3D网格
-    grid = np.zeros((grid_size, grid_size, grid_size))
-    
     # 将点云映射到网格上
     # 归一化点坐标到[0, 1]范围
     normalized_points = (points[:, :3] - min_bound) / (max_bound - min_bound)
-    
-    # 映射到网格坐标
-    grid_coords = (normalized_points * (grid_size - 1)).astype(int)
-    
+
+    # 映射到网格坐标（原地缩放，避免额外的临时数组）
+    np.multiply(normalized_points, grid_size - 1, out=normalized_points)
+    grid_coords = normalized_points.astype(np.int64)
+
     # 确保坐标不会越界
-    grid_coords = np.clip(grid_coords, 0, grid_size - 1)
-    
-    # 在对应的网格位置增加值
-    for coord in grid_coords:
-        grid[coord[0], coord[1], coord[2]] += 1
+    np.clip(grid_coords, 0, grid_size - 1, out=grid_coords)
+
+    # 将三维网格坐标展平为线性索引，一次性统计每个网格中的点数
+    linear_idx = (grid_coords[:, 0] * grid_size + grid_coords[:, 1]) * grid_size + grid_coords[:, 2]
+    # 体素计数使用float32存储，精度足够且内存带宽减半
+    grid = np.bincount(linear_idx, minlength=grid_size ** 3).astype(np.float32).reshape(
+        (grid_size, grid_size, grid_size)
+    )
     
-    # 执行3D FFT
-    fft_result = fftpack.fftn(grid)
-    fft_shifted = fftpack.fftshift(fft_result)
+    # 执行3D实数FFT（最后一个轴只计算非负频率，另一半由共轭对称性给出）
+    fft_result = rfftn(grid, workers=-1)
+    fft_shifted = fftshift(fft_result, axes=(0, 1))
     
     # 计算幅度谱
     magnitude_spectrum = np.abs(fft_shifted)
     
     # 计算频率空间中的半径
     freq_cube = np.fft.fftshift(np.fft.fftfreq(grid_size))
-    freq_x, freq_y, freq_z = np.meshgrid(freq_cube, freq_cube, freq_cube, indexing='ij')
+    freq_half = np.fft.rfftfreq(grid_size)
+    freq_x, freq_y, freq_z = np.meshgrid(freq_cube, freq_cube, freq_half, indexing='ij')
     freq_radius = np.sqrt(freq_x**2 + freq_y**2 + freq_z**2)
     
     # 计算径向平均轮廓
@@ -190,12 +289,18 @@ def compute_3d_fft_spectrum(points, grid_size=64):
     bin_indices = (freq_radius / max_radius * radial_bins).astype(int)
     bin_indices = np.clip(bin_indices, 0, radial_bins - 1)
     
-    # 计算每个径向bin的平均幅度
-    radial_profile = np.zeros(radial_bins)
-    for i in range(radial_bins):
-        mask = bin_indices == i
-        if np.any(mask):
-            radial_profile[i] = np.mean(magnitude_spectrum[mask])
+    # 半谱中除零频率（以及偶数网格的Nyquist频率）外，每个z频率都代表正负两个频率
+    multiplicity = np.full(freq_half.shape, 2.0)
+    multiplicity[0] = 1.0
+    if grid_size % 2 == 0:
+        multiplicity[-1] = 1.0
+    weights = np.broadcast_to(multiplicity, freq_radius.shape).ravel()
+    
+    # 计算每个径向bin的平均幅度（单次遍历求和与计数）
+    flat_idx = bin_indices.ravel()
+    sums = np.bincount(flat_idx, weights=magnitude_spectrum.ravel() * weights, minlength=radial_bins)
+    counts = np.bincount(flat_idx, weights=weights, minlength=radial_bins)
+    radial_profile = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
     
     return magnitude_spectrum, freq_radius, radial_profile
 
@@ -215,10 +320,9 @@ def plot_3d_fft_analysis(points, output_dir=None):
     # 计算3D FFT
     magnitude_spectrum, freq_radius, radial_profile = compute_3d_fft_spectrum(points)
     
-    # 绘制中心切片的频谱图
-    center = magnitude_spectrum.shape[0] // 2
+    # 绘制中心切片的频谱图（z方向零频率平面）
     plt.figure(figsize=(10, 8))
-    plt.imshow(np.log(1 + magnitude_spectrum[center, :, :]), cmap='hot')
+    plt.imshow(np.log(1 + magnitude_spectrum[:, :, 0]), cmap='hot')
     plt.colorbar(label='Log Magnitude')
     plt.title('3D FFT Spectrum (Center Slice)', fontweight='bold')
     plt.xlabel('Frequency Index')
@@ -259,8 +363,11 @@ def analyze_and_plot_all_histograms(points, output_dir=None):
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
+    # 一次遍历计算所有直方图
+    histograms = _compute_all_histograms(points, bins=100, proj_resolution=0.1)
+    
     # 1. Z轴高度直方图
-    h_hist, h_bin_edges = compute_h_histogram(points, bins=100, axis=2)
+    h_hist, h_bin_edges = histograms["z"]
     fig1 = plot_histogram(h_hist, h_bin_edges, 
                          title="Z-Axis Height Histogram", 
                          xlabel="Height (Z-Axis)", 
@@ -275,7 +382,7 @@ def analyze_and_plot_all_histograms(points, output_dir=None):
         plt.show()
     
     # 2. 点投影直方图 (默认Z轴方向)
-    ppf_hist, ppf_bin_edges = compute_point_projection_histogram(points, resolution=0.1)
+    ppf_hist, ppf_bin_edges = histograms["projection"]
     fig2 = plot_histogram(ppf_hist, ppf_bin_edges,
                          title="Point Projection Histogram (Z-Axis Direction)",
                          xlabel="Projection on Z-Axis",
@@ -290,7 +397,7 @@ def analyze_and_plot_all_histograms(points, output_dir=None):
         plt.show()
     
     # 3. X轴直方图
-    x_hist, x_bin_edges = compute_h_histogram(points, bins=100, axis=0)
+    x_hist, x_bin_edges = histograms["x"]
     fig3 = plot_histogram(x_hist, x_bin_edges, 
                          title="X-Axis Distribution Histogram", 
                          xlabel="X Coordinate", 
@@ -305,7 +412,7 @@ def analyze_and_plot_all_histograms(points, output_dir=None):
         plt.show()
     
     # 4. Y轴直方图
-    y_hist, y_bin_edges = compute_h_histogram(points, bins=100, axis=1)
+    y_hist, y_bin_edges = histograms["y"]
     fig4 = plot_histogram(y_hist, y_bin_edges, 
                          title="Y-Axis Distribution Histogram", 
                          xlabel="Y Coordinate", 
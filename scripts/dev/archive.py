@@ -5,11 +5,30 @@
 将训练结果从runs目录归档到records目录下
 """
 
+import os
 import shutil
 import sys
 from pathlib import Path
 from datetime import datetime
 
+# 直接运行scripts/dev下的脚本时按模块名导入，从项目根目录导入时按包路径导入
+try:
+    from scripts.dev.common import latest_subdir
+except ImportError:
+    from common import latest_subdir
+
+
+def _link_or_copy(src, dst):
+    """
+    以硬链接方式归档文件，跨文件系统等无法创建硬链接时退回到复制
+    归档目录是只读快照，硬链接可避免重复占用磁盘空间
+    """
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
 
 def archive_training_results():
     """
@@ -27,18 +46,16 @@ def archive_training_results():
         records_dir.mkdir(parents=True, exist_ok=True)
         
         # 检查源目录是否存在训练结果
-        if not runs_detect_dir.exists() or not any(runs_detect_dir.iterdir()):
+        if not runs_detect_dir.exists():
             print("未找到任何训练结果")
             return False
         
-        # 获取最新的训练目录（按修改时间排序）
-        train_dirs = [d for d in runs_detect_dir.iterdir() if d.is_dir()]
-        if not train_dirs:
+        # 获取最新的训练目录（按修改时间）
+        latest_train_dir = latest_subdir(runs_detect_dir)
+        if latest_train_dir is None:
             print("未找到任何训练目录")
             return False
-            
-        # 按修改时间排序，获取最新的训练目录
-        latest_train_dir = max(train_dirs, key=lambda p: p.stat().st_mtime)
+        
         print(f"找到最新训练目录: {latest_train_dir.name}")
         
         # 生成归档目录名称：年月日-顺序编号
@@ -53,7 +70,7 @@ def archive_training_results():
         # 创建归档目录
         archive_dir.mkdir(exist_ok=True)
         
-        # 复制所有文件和目录到归档目录
+        # 将所有文件和目录归档（除best.pt外均使用硬链接）
         print(f"正在归档到: {archive_dir}")
         
         for item in latest_train_dir.iterdir():
@@ -63,17 +80,17 @@ def archive_training_results():
                     weights_dir = archive_dir / item.name
                     weights_dir.mkdir(exist_ok=True)
                     
-                    # 只复制best.pt文件
+                    # 只复制best.pt文件（真实复制，后续可能在原位置继续微调）
                     best_pt = item / "best.pt"
                     if best_pt.exists():
                         shutil.copy2(best_pt, weights_dir / "best.pt")
                         print(f"已复制: best.pt")
                 else:
-                    # 复制其他目录
-                    shutil.copytree(item, archive_dir / item.name)
+                    # 归档其他目录
+                    shutil.copytree(item, archive_dir / item.name, copy_function=_link_or_copy)
             else:
-                # 复制非目录文件
-                shutil.copy2(item, archive_dir / item.name)
+                # 归档非目录文件
+                _link_or_copy(item, archive_dir / item.name)
         
         print(f"训练结果已成功归档到: {archive_dir}")
         return True
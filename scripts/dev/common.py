@@ -0,0 +1,102 @@
+#.venv/bin/python3
+# -*- coding: utf-8 -*-
+"""
+训练脚本公共工具
+train.py、continuous_train.py、to_onnx.py共用的文件系统和配置读取辅助函数
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+from pathlib import Path
+import pickle
+
+# 并发执行文件系统元数据操作的最大线程数
+IO_WORKERS = 16
+# 元素少于该数量时直接串行执行，避免创建线程池的开销
+MIN_CONCURRENT_ITEMS = 32
+
+# hyp.yaml中不直接传递给model.train()的键
+NON_TRAIN_KEYS = frozenset({"optimizer", "Adam", "SGD", "AdamW", "augment", "early_stop",
+                            "gradient_checkpointing"})
+
+
+def map_concurrent(func, items):
+    """
+    使用线程池并发地对每个元素执行func，按原顺序返回结果列表
+    适用于stat等元数据操作：网络文件系统上每次调用都是一次远程往返，
+    系统调用期间会释放GIL，并发执行可以重叠这些等待
+    元素较少时串行执行，线程池的创建开销反而更大
+    """
+    items = list(items)
+    if len(items) < MIN_CONCURRENT_ITEMS:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(IO_WORKERS, len(items))) as pool:
+        return list(pool.map(func, items))
+
+
+def latest_subdir(path):
+    """
+    获取目录下修改时间最新的子目录
+    使用os.scandir单次遍历，DirEntry自带类型信息，减少stat系统调用
+    类型判断和stat都不跟随符号链接，指向目录的符号链接不计入
+    没有子目录时返回None
+    """
+    with os.scandir(path) as it:
+        latest = max(
+            (e for e in it if e.is_dir(follow_symlinks=False)),
+            key=lambda e: e.stat(follow_symlinks=False).st_mtime,
+            default=None,
+        )
+    return Path(latest.path) if latest is not None else None
+
+
+def subdirs_by_mtime(path):
+    """
+    获取目录下的所有子目录，按修改时间从新到旧排序
+    使用os.scandir单次遍历，每个目录只stat一次，stat调用并发执行
+    """
+    with os.scandir(path) as it:
+        dirs = [e for e in it if e.is_dir(follow_symlinks=False)]
+    mtimes = map_concurrent(lambda e: e.stat(follow_symlinks=False).st_mtime, dirs)
+    order = sorted(range(len(dirs)), key=mtimes.__getitem__, reverse=True)
+    return [Path(dirs[i].path) for i in order]
+
+
+def load_yaml_cached(path):
+    """
+    读取YAML配置文件，并将解析结果缓存为同目录下的pickle文件
+    缓存以YAML文件的修改时间(纳秒)为键，YAML未变化时直接读取缓存，跳过YAML解析
+    """
+    path = Path(path)
+    cache_path = path.with_suffix(".yaml.pkl")
+    mtime_ns = path.stat().st_mtime_ns
+    
+    # 缓存有效时直接返回
+    try:
+        with open(cache_path, "rb") as f:
+            cached_mtime_ns, data = pickle.load(f)
+        if cached_mtime_ns == mtime_ns:
+            return data
+    except (OSError, pickle.PickleError, EOFError, ValueError, TypeError):
+        pass
+    
+    # 仅在缓存失效时才导入yaml，优先使用libyaml的C实现
+    import yaml
+    try:
+        from yaml import CSafeLoader as YamlLoader
+    except ImportError:
+        from yaml import SafeLoader as YamlLoader
+    
+    with open(path, "r") as f:
+        data = yaml.load(f, Loader=YamlLoader)
+    
+    # 先写入临时文件再替换，避免留下不完整的缓存
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump((mtime_ns, data), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"写入配置缓存失败: {e}")
+    
+    return data
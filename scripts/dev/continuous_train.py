@@ -4,37 +4,39 @@ YOLO 模型持续训练脚本
 用于实现更好的训练策略，避免反复重启训练
 """
 
+from concurrent.futures import ThreadPoolExecutor
 import os
 from pathlib import Path
 import sys
 import time
-import yaml
 from datetime import datetime
 
 import torch
 from ultralytics import YOLO
 
 from archive import archive_training_results
+from common import NON_TRAIN_KEYS, load_yaml_cached, map_concurrent, subdirs_by_mtime
+
+# polars可按需流式读取CSV，未安装时退回到按字节读取文件末尾
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+# results.csv中mAP50所在的列名
+MAP50_COLUMN = "metrics/mAP50(B)"
 
 
 def find_latest_model_weights(model_records_path):
     """
     查找最新的模型权重文件
-    按修改时间排序，选择最新的目录中的best.pt文件
+    按修改时间从新到旧遍历训练记录目录，返回第一个存在的best.pt文件
+    所有目录中都没有best.pt时返回None
     """
-    # 获取所有训练记录目录
-    record_dirs = [d for d in model_records_path.iterdir() if d.is_dir()]
-    
-    if not record_dirs:
-        return None
-    
-    # 按修改时间排序，获取最新的目录
-    latest_dir = max(record_dirs, key=lambda x: x.stat().st_mtime)
-    best_pt_path = latest_dir / "weights" / "best.pt"
-    
-    # 检查best.pt是否存在
-    if best_pt_path.exists():
-        return best_pt_path
+    for record_dir in subdirs_by_mtime(model_records_path):
+        best_pt_path = record_dir / "weights" / "best.pt"
+        if best_pt_path.exists():
+            return best_pt_path
     
     return None
 
@@ -57,13 +59,15 @@ def list_available_models(model_records_path, original_model_path):
     
     # 添加训练记录中的模型
     if model_records_path.exists():
-        record_dirs = [d for d in model_records_path.iterdir() if d.is_dir()]
         # 按修改时间排序，最新的在前面
-        record_dirs.sort(key=lambda x: x.stat().st_mtime, reverse=True)
+        record_dirs = subdirs_by_mtime(model_records_path)
+        best_pt_paths = [d / "weights" / "best.pt" for d in record_dirs]
         
-        for i, record_dir in enumerate(record_dirs):
-            best_pt_path = record_dir / "weights" / "best.pt"
-            if best_pt_path.exists():
+        # 并发检查各目录下的best.pt是否存在
+        for record_dir, best_pt_path, exists in zip(
+            record_dirs, best_pt_paths, map_concurrent(Path.exists, best_pt_paths)
+        ):
+            if exists:
                 models.append((record_dir.name, str(best_pt_path)))
     
     return models
@@ -100,9 +104,57 @@ def select_model_interactive(models):
         return None
 
 
-def evaluate_training_progress(results_dir):
+def _tail_lines(file_path, num_lines, block_size=8192):
+    """
+    读取文件末尾的若干个非空行
+    从文件尾部按块向前读取，不必将整个文件载入内存
+    """
+    with open(file_path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        # 读取到足够的换行符或到达文件开头为止
+        while pos > 0 and data.count(b"\n") <= num_lines:
+            read_size = min(block_size, pos)
+            pos -= read_size
+            f.seek(pos)
+            data = f.read(read_size) + data
+    
+    lines = [line for line in data.splitlines() if line.strip()]
+    # 未读到文件开头时，第一行可能不完整
+    if pos > 0:
+        lines = lines[1:]
+    return [line.decode("utf-8") for line in lines[-num_lines:]]
+
+
+def _read_recent_map50(results_csv, num_rows):
+    """
+    读取results.csv最后num_rows行的mAP50值，按epoch顺序返回列表
+    优先使用polars按列名读取，列名不匹配时退回到按列索引解析末尾行
+    """
+    if pl is not None:
+        try:
+            df = pl.scan_csv(results_csv).select(MAP50_COLUMN).tail(num_rows).collect()
+            return df.to_series().to_list()
+        except Exception:
+            pass
+    
+    # 多读取一行：文件较短时第一行是标题行，否则是不需要的数据行
+    lines = _tail_lines(results_csv, num_rows + 1)[1:]
+    
+    # mAP50在第8列（索引7）
+    return [float(line.strip().split(',')[7]) for line in lines]
+
+
+def evaluate_training_progress(results_dir, window=5, min_delta=1e-3):
     """
     评估训练进度，检查是否应该继续训练
+    mAP50达到目标值，或最近window个epoch的mAP50变化小于min_delta时停止训练
+    
+    Args:
+        results_dir: 训练结果目录
+        window: 判断停滞所用的epoch数量
+        min_delta: 视为仍在提升的最小mAP50变化量
     """
     try:
         # 检查results目录是否存在
@@ -114,30 +166,27 @@ def evaluate_training_progress(results_dir):
         if not results_csv.exists():
             return True  # 如果没有结果文件，继续训练
             
-        # 读取结果文件，检查最近几次的mAP值
-        with open(results_csv, 'r') as f:
-            lines = f.readlines()
-            
-        if len(lines) < 2:  # 至少需要标题行和一行数据
+        # 读取最近几次的mAP值
+        try:
+            recent_map50 = _read_recent_map50(results_csv, window)
+        except ValueError:
+            # 如果解析失败，默认继续训练
             return True
-            
-        # 解析最后一行数据
-        last_line = lines[-1].strip().split(',')
-        # mAP50通常在特定列，这里简单处理
-        if len(last_line) >= 5:
-            # 假设mAP50在第5列（索引4）
-            try:
-                map50 = float(last_line[7])  # 根据CSV结构调整列索引
-                print(f"当前mAP50值: {map50}")
-                
-                # 如果mAP50还没有达到满意的水平，继续训练
-                if map50 < 0.92:  # 提高阈值以获得更好的性能
-                    return True
-                else:
-                    return False
-            except ValueError:
-                # 如果解析失败，默认继续训练
-                return True
+        
+        if not recent_map50:
+            return True
+        
+        map50 = recent_map50[-1]
+        print(f"当前mAP50值: {map50}")
+        
+        # 如果mAP50已经达到满意的水平，停止训练
+        if map50 >= 0.92:  # 提高阈值以获得更好的性能
+            return False
+        
+        # 如果mAP50已经停滞，继续训练也难以提升
+        if len(recent_map50) >= window and max(recent_map50) - min(recent_map50) < min_delta:
+            print(f"最近{window}个epoch的mAP50变化小于{min_delta}，训练已停滞")
+            return False
         
         return True
     except Exception as e:
@@ -145,6 +194,21 @@ def evaluate_training_progress(results_dir):
         return True  # 出错时默认继续训练
 
 
+def _wait_for_archive(archive_future):
+    """
+    等待后台归档任务完成并输出结果
+    """
+    if archive_future is None:
+        return
+    try:
+        if archive_future.result():
+            print("训练结果归档成功")
+        else:
+            print("训练结果归档失败")
+    except Exception as e:
+        print(f"归档过程中发生错误: {e}")
+
+
 def continuous_train(max_cycles=3):
     """
     持续训练函数，可以多次循环训练直到满足条件
@@ -154,102 +218,114 @@ def continuous_train(max_cycles=3):
     """
     cycle = 0
     
-    while cycle < max_cycles:
-        cycle += 1
-        print(f"\n开始第 {cycle}/{max_cycles} 轮训练")
-        
-        # 设备选择
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"使用设备: {device}")
-        model_path = "scripts/model"
-        # 配置文件路径
-        data_config = "scripts/hyper/dataset.yaml"
-        hyp_config_path = "scripts/hyper/hyp.yaml"  # 使用统一的超参数配置文件
-        
-        # 加载超参数配置
-        with open(hyp_config_path, "r") as f:
-            hyp_config = yaml.safe_load(f)
-        
-        # 初始化模型 - 优先使用最新的best.pt，备选使用original下的yolo11n.pt
-        model_records_path = Path("scripts/model/records")
-        original_model_path = Path("scripts/model/original/yolo11n.pt")
-        
-        # 获取所有可用模型并让用户选择
-        available_models = list_available_models(model_records_path, original_model_path)
-        selected_model_path = select_model_interactive(available_models)
-        
-        # 根据用户选择或默认逻辑确定模型文件
-        if selected_model_path:
-            model_file = selected_model_path
-            print(f"使用用户选择的模型权重: {model_file}")
-        else:
-            # 尝试查找最新的best.pt
-            latest_model_file = find_latest_model_weights(model_records_path)
+    # 设备选择
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    print(f"使用设备: {device}")
+    
+    # 配置文件路径
+    data_config = "scripts/hyper/dataset.yaml"
+    hyp_config_path = "scripts/hyper/hyp.yaml"  # 使用统一的超参数配置文件
+    
+    # 模型路径 - 优先使用最新的best.pt，备选使用original下的yolo11n.pt
+    model_records_path = Path("scripts/model/records")
+    original_model_path = Path("scripts/model/original/yolo11n.pt")
+    runs_detect_path = Path("runs/detect")
+    
+    # 加载超参数配置（各轮训练共用）
+    hyp_config = load_yaml_cached(hyp_config_path)
+    early_stop = hyp_config.get("early_stop") or {}
+    early_stop_window = early_stop.get("window", 5)
+    early_stop_min_delta = early_stop.get("min_delta", 1e-3)
+    
+    # 归档在后台线程中执行，与轮次间的等待重叠
+    archive_pool = ThreadPoolExecutor(max_workers=1)
+    archive_future = None
+    
+    # 训练异常退出时也要等待后台归档完成并关闭线程池
+    try:
+        while cycle < max_cycles:
+            cycle += 1
+            print(f"\n开始第 {cycle}/{max_cycles} 轮训练")
             
-            if latest_model_file and latest_model_file.exists():
-                model_file = latest_model_file
-                print(f"使用最新的模型权重: {model_file}")
-            elif original_model_path.exists():
-                model_file = original_model_path
-                print(f"使用原始模型权重: {model_file}")
-            else:
-                raise FileNotFoundError(f"未找到任何可用的模型文件")
-        
-        # 创建唯一的训练名称，避免覆盖之前的训练结果
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        train_name = f"yolo11n_continuous_{timestamp}"
-        
-        model = YOLO(str(model_file))
-        
-        # 准备数据增强参数
-        augment_params = hyp_config.get("augment", {})
-        
-        # 准备优化器参数
-        optimizer_name = hyp_config["optimizer"]
-        optimizer_params = hyp_config.get(optimizer_name, {})
-        
-        # 合并所有训练参数，避免重复传递
-        train_params = {}
-        # 添加训练参数（除了优化器相关）
-        for key, value in hyp_config.items():
-            if key not in ["optimizer", "Adam", "SGD", "AdamW", "augment"]:
-                train_params[key] = value
-        train_params.update(augment_params)  # 数据增强参数
-        train_params.update(optimizer_params)  # 优化器参数
-        
-        # 执行训练
-        print("开始训练...")
-        results = model.train(
-            data=str(data_config),
-            optimizer=optimizer_name,  # 传递优化器名称
-            device=device,
-            pretrained=True,
-            name=train_name,
-            save=True,
-            **train_params  # 传递合并后的所有参数
-        )
-        
-        # 检查训练结果目录
-        runs_dir = "runs" / "detect" / train_name
-        if evaluate_training_progress(runs_dir):
-            print("模型还需要继续训练，准备下一轮训练...")
+            # 模型选择依赖上一轮的归档结果，需先等待其完成
+            _wait_for_archive(archive_future)
+            archive_future = None
             
-            # 训练完成后自动归档结果
-            print("正在归档本轮训练结果...")
-            try:
-                if archive_training_results():
-                    print("训练结果归档成功")
+            # 获取所有可用模型并让用户选择
+            available_models = list_available_models(model_records_path, original_model_path)
+            selected_model_path = select_model_interactive(available_models)
+            
+            # 根据用户选择或默认逻辑确定模型文件
+            if selected_model_path:
+                model_file = selected_model_path
+                print(f"使用用户选择的模型权重: {model_file}")
+            else:
+                # 尝试查找最新的best.pt
+                latest_model_file = find_latest_model_weights(model_records_path)
+                
+                if latest_model_file is not None:
+                    model_file = latest_model_file
+                    print(f"使用最新的模型权重: {model_file}")
+                elif original_model_path.exists():
+                    model_file = original_model_path
+                    print(f"使用原始模型权重: {model_file}")
                 else:
-                    print("训练结果归档失败")
-            except Exception as e:
-                print(f"归档过程中发生错误: {e}")
+                    raise FileNotFoundError(f"未找到任何可用的模型文件")
+            
+            # 创建唯一的训练名称，避免覆盖之前的训练结果
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            train_name = f"yolo11n_continuous_{timestamp}"
+            
+            model = YOLO(str(model_file))
+            
+            # 准备数据增强参数
+            augment_params = hyp_config.get("augment", {})
+            
+            # 准备优化器参数
+            optimizer_name = hyp_config["optimizer"]
+            optimizer_params = hyp_config.get(optimizer_name, {})
+            
+            # 合并所有训练参数，避免重复传递
+            # 添加训练参数（除了优化器相关）
+            train_params = {k: v for k, v in hyp_config.items() if k not in NON_TRAIN_KEYS}
+            train_params |= augment_params  # 数据增强参数
+            train_params |= optimizer_params  # 优化器参数
+            if device != "cuda":
+                train_params["compile"] = False  # torch.compile只在GPU上启用
+            
+            # 执行训练
+            print("开始训练...")
+            results = model.train(
+                data=data_config,
+                optimizer=optimizer_name,  # 传递优化器名称
+                device=device,
+                pretrained=True,
+                name=train_name,
+                save=True,
+                **train_params  # 传递合并后的所有参数
+            )
+            
+            # 检查训练结果目录
+            runs_dir = runs_detect_path / train_name
+            if evaluate_training_progress(
+                runs_dir, window=early_stop_window, min_delta=early_stop_min_delta
+            ):
+                print("模型还需要继续训练，准备下一轮训练...")
                 
-            if cycle < max_cycles:
-                print(f"等待10秒后开始下一轮训练...")
-                time.sleep(10)  # 等待一段时间再开始下一轮训练
-        else:
-            print("模型训练已达到满意效果，停止训练")
-            break
+                # 训练完成后在后台归档结果
+                print("正在归档本轮训练结果...")
+                archive_future = archive_pool.submit(archive_training_results)
+                    
+                if cycle < max_cycles:
+                    print(f"等待10秒后开始下一轮训练...")
+                    time.sleep(10)  # 等待一段时间再开始下一轮训练
+            else:
+                print("模型训练已达到满意效果，停止训练")
+                break
+    finally:
+        # 等待尚未完成的归档任务
+        _wait_for_archive(archive_future)
+        archive_pool.shutdown(wait=True)
     
     # 最终归档
     print("正在进行最终归档...")
@@ -18,15 +18,20 @@ def main():
     device = "cuda" if torch.cuda.is_available() else "cpu"
     print(f"使用设备: {device}")
     
-    hyper_path = "scripts/hyper"
-    model_path = "scripts/model"
+    # 输入尺寸固定，启用cuDNN自动调优选择最快的卷积算法
+    if device == "cuda":
+        torch.backends.cudnn.benchmark = True
+        torch.set_float32_matmul_precision("high")
+    
+    hyper_path = Path("scripts/hyper")
+    model_path = Path("scripts/model")
     
     # 配置文件路径
     data_config = hyper_path / "dataset.yaml"
     
     # 查找最佳模型权重文件
     best_model_path = None
-    weights_dir = Path("runs" / "detect")
+    weights_dir = Path("runs") / "detect"
     
     # 遍历所有训练运行目录，找到最新的yolo11n5运行
     yolo11n5_runs = list(weights_dir.glob("yolo11n5*"))
@@ -53,6 +58,8 @@ def main():
     
     # 加载模型
     model = YOLO(str(model_file))
+    # 融合Conv+BN层，减少推理时的内核调用
+    model.fuse()
     
     # 执行验证
     print("开始评估模型...")
@@ -62,6 +69,7 @@ def main():
         batch=4,
         device=device,
         workers=4,
+        half=(device == "cuda"),  # GPU上使用FP16推理
         verbose=True
     )
     
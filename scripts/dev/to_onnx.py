@@ -16,25 +16,19 @@ py_scripts_path = project_root / "py-scripts"
 sys.path.insert(0, str(project_root))
 sys.path.insert(0, str(py_scripts_path))
 
+from scripts.dev.common import load_yaml_cached, subdirs_by_mtime
+
 
 def find_latest_model_weights(model_records_path):
     """
     查找最新的模型权重文件
-    按修改时间排序，选择最新的目录中的best.pt文件
+    按修改时间从新到旧遍历训练记录目录，返回第一个存在的best.pt文件
+    所有目录中都没有best.pt时返回None
     """
-    # 获取所有训练记录目录
-    record_dirs = [d for d in model_records_path.iterdir() if d.is_dir()]
-    
-    if not record_dirs:
-        return None
-    
-    # 按修改时间排序，获取最新的目录
-    latest_dir = max(record_dirs, key=lambda x: x.stat().st_mtime)
-    best_pt_path = latest_dir / "weights" / "best.pt"
-    
-    # 检查best.pt是否存在
-    if best_pt_path.exists():
-        return best_pt_path
+    for record_dir in subdirs_by_mtime(model_records_path):
+        best_pt_path = record_dir / "weights" / "best.pt"
+        if best_pt_path.exists():
+            return best_pt_path
     
     return None
 
@@ -54,7 +48,7 @@ def auto_select_model():
     # 尝试查找最新的best.pt
     latest_model_file = find_latest_model_weights(model_records_path)
     
-    if latest_model_file and latest_model_file.exists():
+    if latest_model_file is not None:
         model_file = latest_model_file
         print(f"使用最新的模型权重: {model_file}")
     elif original_model_path.exists():
@@ -66,16 +60,31 @@ def auto_select_model():
     return str(model_file)
 
 
-def main():
+def main(half=False):
+    """
+    导出ONNX模型
+    
+    Args:
+        half: 是否导出FP16模型（Rust端推理使用f32输入，默认导出FP32）
+    """
     # 自动选择模型
     model_file = auto_select_model()
     
+    # 读取训练时使用的输入尺寸，导出固定尺寸的模型
+    hyp_config_path = Path(__file__).parent.parent.absolute() / "hyper" / "hyp.yaml"
+    imgsz = load_yaml_cached(hyp_config_path)["imgsz"]
+    
     # 加载YOLO11模型
     model = YOLO(model_file)
     
     # 导出自定义名称的ONNX模型到指定目录
     model.export(format="onnx",  
                 nms=True,
+                imgsz=imgsz,
+                half=half,
+                dynamic=False,
+                simplify=True,
+                opset=17,
     )
     
     # 获取最新模型权重所在的目录
@@ -94,9 +103,12 @@ def main():
     target_dir = project_root / "module" / "color"
     target_dir.mkdir(parents=True, exist_ok=True)
     
-    # 移动并重命名ONNX模型
+    # 移动并重命名ONNX模型（同一文件系统内直接原子重命名，否则退回到复制）
     final_onnx_path = target_dir / "yolo11n.onnx"
-    shutil.move(str(exported_onnx_path), str(final_onnx_path))
+    try:
+        os.replace(exported_onnx_path, final_onnx_path)
+    except OSError:
+        shutil.move(str(exported_onnx_path), str(final_onnx_path))
     print(f"ONNX模型已移动至: {final_onnx_path}")
     
     # 加载移动后的ONNX模型
@@ -4,13 +4,10 @@ YOLO 模型训练脚本
 用于训练自定义数据集的目标检测模型
 """
 
+import os
 from pathlib import Path
 import sys
 
-import torch
-from ultralytics import YOLO
-import yaml
-
 # 使用统一的路径处理方法
 # 添加项目根目录到Python路径
 project_root = Path(__file__).parent.parent.parent.absolute()
@@ -18,26 +15,19 @@ sys.path.insert(0, str(project_root))
 
 # 导入自定义工具
 from scripts.dev.archive import archive_training_results
+from scripts.dev.common import NON_TRAIN_KEYS, load_yaml_cached, map_concurrent, subdirs_by_mtime
 
 
 def find_latest_model_weights(model_records_path):
     """
     查找最新的模型权重文件
-    按修改时间排序，选择最新的目录中的best.pt文件
+    按修改时间从新到旧遍历训练记录目录，返回第一个存在的best.pt文件
+    所有目录中都没有best.pt时返回None
     """
-    # 获取所有训练记录目录
-    record_dirs = [d for d in model_records_path.iterdir() if d.is_dir()]
-    
-    if not record_dirs:
-        return None
-    
-    # 按修改时间排序，获取最新的目录
-    latest_dir = max(record_dirs, key=lambda x: x.stat().st_mtime)
-    best_pt_path = latest_dir / "weights" / "best.pt"
-    
-    # 检查best.pt是否存在
-    if best_pt_path.exists():
-        return best_pt_path
+    for record_dir in subdirs_by_mtime(model_records_path):
+        best_pt_path = record_dir / "weights" / "best.pt"
+        if best_pt_path.exists():
+            return best_pt_path
     
     return None
 
@@ -54,13 +44,15 @@ def list_available_models(model_records_path, original_model_path):
     
     # 添加训练记录中的模型
     if model_records_path.exists():
-        record_dirs = [d for d in model_records_path.iterdir() if d.is_dir()]
         # 按修改时间排序，最新的在前面
-        record_dirs.sort(key=lambda x: x.stat().st_mtime, reverse=True)
+        record_dirs = subdirs_by_mtime(model_records_path)
+        best_pt_paths = [d / "weights" / "best.pt" for d in record_dirs]
         
-        for i, record_dir in enumerate(record_dirs):
-            best_pt_path = record_dir / "weights" / "best.pt"
-            if best_pt_path.exists():
+        # 并发检查各目录下的best.pt是否存在
+        for record_dir, best_pt_path, exists in zip(
+            record_dirs, best_pt_paths, map_concurrent(Path.exists, best_pt_paths)
+        ):
+            if exists:
                 models.append((record_dir.name, str(best_pt_path)))
     
     return models
@@ -97,48 +89,173 @@ def select_model_interactive(models):
         return None
 
 
+def _to_channels_last(trainer):
+    """
+    训练开始前将模型转换为channels_last内存格式
+    cuDNN可直接使用NHWC卷积内核，避免布局转换
+    """
+    import torch
+    
+    trainer.model.to(memory_format=torch.channels_last)
+
+
+class _CheckpointedForward:
+    """
+    梯度检查点混入类，与原始层类组合成子类后替换层的__class__
+    不改变模块结构，state_dict的键保持不变，EMA可以按键名更新
+    """
+    
+    def forward(self, x):
+        import torch
+        from torch.utils.checkpoint import checkpoint
+        
+        if not (self.training and torch.is_grad_enabled()):
+            return super().forward(x)
+        
+        # 首次调用是正常的前向传播，之后的调用是反向传播时的重算
+        calls = []
+        
+        def run(x):
+            if not calls:
+                calls.append(True)
+                return super(_CheckpointedForward, self).forward(x)
+            # 重算会再次更新BatchNorm的running_mean/running_var，先保存再恢复
+            # 重算可能被提前终止，因此在finally中恢复
+            bn_buffers = [
+                b for m in self.modules()
+                if isinstance(m, torch.nn.modules.batchnorm._BatchNorm)
+                for b in m.buffers()
+            ]
+            saved = [b.clone() for b in bn_buffers]
+            try:
+                return super(_CheckpointedForward, self).forward(x)
+            finally:
+                with torch.no_grad():
+                    for b, s in zip(bn_buffers, saved):
+                        b.copy_(s)
+        
+        return checkpoint(run, x, use_reentrant=False)
+    
+    def __reduce_ex__(self, protocol):
+        # deepcopy和pickle时还原为原始类，EMA副本和保存的权重不包含梯度检查点
+        _, _, *state = super().__reduce_ex__(protocol)
+        return (object.__new__, (type(self).__bases__[1],), *state)
+
+
+# 原始层类到启用梯度检查点的子类的映射
+_CHECKPOINTED_CLASSES = {}
+
+
+def _enable_gradient_checkpointing(trainer):
+    """
+    训练开始前为骨干网络各层启用梯度检查点
+    反向传播时重新计算中间激活值，以额外计算换取显存，从而支持更大的batch
+    """
+    from ultralytics.utils.torch_utils import unwrap_model
+    
+    model = unwrap_model(trainer.model)
+    num_backbone_layers = len(model.yaml["backbone"])
+    for layer in model.model[:num_backbone_layers]:
+        # 已启用的层跳过，避免重复组合子类
+        if isinstance(layer, _CheckpointedForward):
+            continue
+        cls = type(layer)
+        if cls not in _CHECKPOINTED_CLASSES:
+            _CHECKPOINTED_CLASSES[cls] = type(cls.__name__, (_CheckpointedForward, cls), {})
+        layer.__class__ = _CHECKPOINTED_CLASSES[cls]
+
+
+def _disable_gradient_checkpointing(trainer):
+    """
+    训练结束后将各层还原为原始类
+    """
+    from ultralytics.utils.torch_utils import unwrap_model
+    
+    for layer in unwrap_model(trainer.model).modules():
+        if isinstance(layer, _CheckpointedForward):
+            layer.__class__ = type(layer).__bases__[1]
+
+
 def main():
     """主训练函数"""
-    # 设备选择
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    print(f"使用设备: {device}")    
     hyper_path = Path("scripts/hyper")
     model_path = Path("scripts/model")
     
     # 配置文件路径
     data_config = hyper_path / "dataset.yaml"
     hyp_config_path = hyper_path / "hyp.yaml"  # 使用统一的超参数配置文件
-    
-    # 加载超参数配置
-    with open(hyp_config_path, "r") as f:
-        hyp_config = yaml.safe_load(f)
+    data_str = str(data_config)
     
     # 初始化模型 - 优先使用最新的best.pt，备选使用original下的yolo11n.pt
     model_records_path = model_path / "records"
     original_model_path = model_path / "original" / "yolo11n.pt"
     
     # 获取所有可用模型并让用户选择
-    available_models = list_available_models(model_records_path, original_model_path)
-    selected_model_path = select_model_interactive(available_models)
+    # 非交互环境（无终端输入或分布式训练子进程）直接使用默认逻辑
+    available_models = None
+    if sys.stdin.isatty() and not os.environ.get("RANK"):
+        available_models = list_available_models(model_records_path, original_model_path)
+        selected_model_path = select_model_interactive(available_models)
+    else:
+        selected_model_path = None
     
     # 根据用户选择或默认逻辑确定模型文件
     if selected_model_path:
         model_file = selected_model_path
-        print(f"使用用户选择的模型权重: {model_file}")
+        model_source = "用户选择的"
     else:
         # 尝试查找最新的best.pt
-        latest_model_file = find_latest_model_weights(model_records_path)
+        if available_models is not None:
+            # 已列出的训练记录按修改时间从新到旧排列，直接复用，避免再次遍历records目录
+            latest_model_file = next(
+                (Path(path) for name, path in available_models if name != "original"), None
+            )
+        else:
+            latest_model_file = find_latest_model_weights(model_records_path)
         
-        if latest_model_file and latest_model_file.exists():
+        if latest_model_file is not None:
             model_file = latest_model_file
-            print(f"使用最新的模型权重: {model_file}")
+            model_source = "最新的"
         elif original_model_path.exists():
             model_file = original_model_path
-            print(f"使用原始模型权重: {model_file}")
+            model_source = "原始"
         else:
             raise FileNotFoundError(f"未找到任何可用的模型文件")
     
-    model = YOLO(str(model_file))
+    model_file_str = str(model_file)
+    print(f"使用{model_source}模型权重: {model_file_str}")
+    
+    # 模型确定后再导入torch和ultralytics，避免选择模型时等待耗时的导入
+    import torch
+    from ultralytics import YOLO
+    
+    # 设备选择
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    print(f"使用设备: {device}")
+    if device == "cuda":
+        props = torch.cuda.get_device_properties(0)
+        free_memory, total_memory = torch.cuda.mem_get_info(0)
+        print(f"GPU: {props.name}, 显存 {total_memory / 1e9:.1f} GB (可用 {free_memory / 1e9:.1f} GB)")
+    
+    # 加载超参数配置
+    hyp_config = load_yaml_cached(hyp_config_path)
+    
+    # GPU上启用TF32，并在输入尺寸固定时启用cuDNN自动调优
+    if device == "cuda":
+        fixed_input_shape = not (hyp_config.get("rect") or hyp_config.get("multi_scale"))
+        torch.backends.cudnn.benchmark = fixed_input_shape
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+        torch.set_float32_matmul_precision("high")
+    
+    model = YOLO(model_file_str)
+    
+    # Trainer会重新构建模型，因此通过回调在训练开始时转换内存格式
+    if device == "cuda":
+        model.add_callback("on_train_start", _to_channels_last)
+    if hyp_config.get("gradient_checkpointing"):
+        model.add_callback("on_train_start", _enable_gradient_checkpointing)
+        model.add_callback("on_train_end", _disable_gradient_checkpointing)
     
     # 准备数据增强参数
     augment_params = hyp_config.get("augment", {})
@@ -148,18 +265,17 @@ def main():
     optimizer_params = hyp_config.get(optimizer_name, {})
     
     # 合并所有训练参数，避免重复传递
-    train_params = {}
     # 添加训练参数（除了优化器相关）
-    for key, value in hyp_config.items():
-        if key not in ["optimizer", "Adam", "SGD", "AdamW", "augment"]:
-            train_params[key] = value
-    train_params.update(augment_params)  # 数据增强参数
-    train_params.update(optimizer_params)  # 优化器参数
+    train_params = {k: v for k, v in hyp_config.items() if k not in NON_TRAIN_KEYS}
+    train_params |= augment_params  # 数据增强参数
+    train_params |= optimizer_params  # 优化器参数
+    if device != "cuda":
+        train_params["compile"] = False  # torch.compile只在GPU上启用
     
     # 执行训练
     print("开始训练...")
     results = model.train(
-        data=str(data_config),
+        data=data_str,
         optimizer=optimizer_name,  # 传递优化器名称
         device=device,
         pretrained=True,